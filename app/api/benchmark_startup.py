@@ -0,0 +1,128 @@
+
+"""
+Mesure le démarrage à froid de l'API : temps jusqu'à la liveness (/health),
+temps jusqu'à la readiness (/ready, modèle chargé) et RSS au repos.
+
+Usage (depuis app/api) :
+    python benchmark_startup.py --runs 3
+    python benchmark_startup.py --importtime   # profil des imports du module main
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def read_rss_mb(pid):
+    """ RSS du processus en Mo (Linux : /proc, sinon psutil si disponible) """
+    status_path = f"/proc/{pid}/status"
+    if os.path.exists(status_path):
+        with open(status_path) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+    except ImportError:
+        return None
+
+def wait_for(url, timeout, proc):
+    """ Attend qu'une URL réponde 200 ; renvoie l'instant (perf_counter) ou None """
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if proc.poll() is not None:
+            return None
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.05)
+    return None
+
+def run_once(port, timeout):
+    """ Lance un serveur, mesure, puis l'arrête """
+    base = f"http://127.0.0.1:{port}"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=API_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        t_alive = wait_for(f"{base}/health", timeout, proc)
+        rss_alive = read_rss_mb(proc.pid)
+        t_ready = wait_for(f"{base}/ready", timeout, proc)
+        # Laisse retomber l'activité avant de mesurer la mémoire au repos
+        time.sleep(1.0)
+        rss_idle = read_rss_mb(proc.pid)
+
+        timings = {}
+        try:
+            with urllib.request.urlopen(f"{base}/health", timeout=5) as response:
+                timings = json.load(response).get("startup_timings", {})
+        except (urllib.error.URLError, OSError):
+            pass
+
+        return {
+            "liveness_s": round(t_alive - t0, 3) if t_alive else None,
+            "readiness_s": round(t_ready - t0, 3) if t_ready else None,
+            "rss_at_liveness_mb": round(rss_alive, 1) if rss_alive else None,
+            "rss_idle_mb": round(rss_idle, 1) if rss_idle else None,
+            "server_timings": timings,
+        }
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def import_profile(top):
+    """ Profil des imports (python -X importtime), trié par temps cumulé """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=API_DIR, capture_output=True, text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # Format : "import time: <propre us> | <cumulé us> | <module>"
+        self_us, cumulative_us, name = [part.strip() for part in line.split(":", 1)[1].split("|")]
+        rows.append((int(cumulative_us), int(self_us), name))
+    rows.sort(reverse=True)
+    print(f"{'cumulé (ms)':>12} {'propre (ms)':>12}  module")
+    for cumulative_us, self_us, name in rows[:top]:
+        print(f"{cumulative_us / 1000:>12.1f} {self_us / 1000:>12.1f}  {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de démarrage à froid de l'API")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--importtime", action="store_true", help="Affiche le profil des imports")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    if args.importtime:
+        import_profile(args.top)
+        return
+
+    results = [run_once(args.port, args.timeout) for _ in range(args.runs)]
+    for i, result in enumerate(results, 1):
+        print(f"Run {i} : {json.dumps(result)}")
+
+    for key in ("liveness_s", "readiness_s", "rss_at_liveness_mb", "rss_idle_mb"):
+        values = sorted(r[key] for r in results if r[key] is not None)
+        if values:
+            print(f"{key:>20} : médiane={values[len(values) // 2]}  min={values[0]}  max={values[-1]}")
+
+if __name__ == "__main__":
+    main()
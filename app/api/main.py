@@ -1,10 +1,26 @@
 
 import os
 import io
+import asyncio
+import hashlib
+import time
+import threading
+import cProfile
+import pstats
+import marshal
+import shutil
+import tempfile
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 import numpy as np
 from PIL import Image
-import tensorflow as tf
-from fastapi import FastAPI, File, UploadFile, HTTPException
+# TensorFlow n'est PAS importé ici : son import coûte plusieurs secondes et
+# plusieurs centaines de Mo. Il est importé dans le thread de chargement du modèle.
+# De même, scipy.ndimage (~0.4 s) n'est importé qu'au premier appel de /analyze.
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
@@ -16,6 +32,42 @@ IMG_WIDTH = 224
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 MODEL_PATH = os.path.join(BASE_DIR, "Experiences", "Models", "UNet_Light_WithAug", "final_model.keras")
 
+# Précision d'inférence : float32 | mixed_float16 | mixed_bfloat16 | int8 (TFLite, CPU)
+PRECISION_MODES = ("float32", "mixed_float16", "mixed_bfloat16", "int8")
+INFERENCE_PRECISION = os.environ.get("INFERENCE_PRECISION", "float32")
+# Jeu de calibration pour valider un mode contre float32
+CALIBRATION_DIR = os.environ.get("CALIBRATION_DIR", os.path.join(BASE_DIR, "data", "test_samples", "images"))
+CALIBRATION_SIZE = int(os.environ.get("CALIBRATION_SIZE", "16"))
+# Garde-fous : accord pixel minimal et perte de mIoU maximale par rapport à float32
+PRECISION_MIN_AGREEMENT = float(os.environ.get("PRECISION_MIN_AGREEMENT", "0.98"))
+PRECISION_MAX_MIOU_DROP = float(os.environ.get("PRECISION_MAX_MIOU_DROP", "0.05"))
+
+# Mode temporel (flux vidéo, /predict_stream)
+# Écart moyen (vignette niveaux de gris [0, 1]) sous lequel on réutilise le masque précédent
+STREAM_DIFF_THRESHOLD = float(os.environ.get("STREAM_DIFF_THRESHOLD", "0.02"))
+# Inférence complète forcée au moins toutes les N images
+STREAM_KEYFRAME_INTERVAL = int(os.environ.get("STREAM_KEYFRAME_INTERVAL", "10"))
+# Lissage temporel des probabilités : poids de la nouvelle inférence (1.0 = pas de lissage)
+STREAM_SMOOTHING = float(os.environ.get("STREAM_SMOOTHING", "0.7"))
+# Au-delà de cet écart on considère un changement de scène (pas de lissage)
+STREAM_SCENE_CUT = float(os.environ.get("STREAM_SCENE_CUT", "0.15"))
+STREAM_MAX_SESSIONS = int(os.environ.get("STREAM_MAX_SESSIONS", "32"))
+STREAM_SESSION_TTL = float(os.environ.get("STREAM_SESSION_TTL", "300"))
+# Taille de la vignette de comparaison (doit diviser IMG_HEIGHT / IMG_WIDTH)
+THUMB_SIZE = 28
+
+# Cache des masques récents (/predict, /analyze), par empreinte du contenu de l'image.
+# La passerelle envoie la même image au même worker : une image répétée évite l'inférence.
+# Un masque 224x224 uint8 pèse ~50 Ko (0 = désactivé)
+MASK_CACHE_SIZE = int(os.environ.get("MASK_CACHE_SIZE", "64"))
+
+# Profilage par requête (?profile=true ou en-tête X-Profile: 1), désactivé par défaut
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+# Nombre de traces conservées (les plus anciennes sont supprimées)
+PROFILE_BUFFER_SIZE = int(os.environ.get("PROFILE_BUFFER_SIZE", "20"))
+# Si défini, les endpoints /admin exigent l'en-tête X-Admin-Token ; requis pour POST /precision
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
 # --- Initialisation de l'App ---
 app = FastAPI(
     title="Segmentation API - P8",
@@ -32,25 +84,108 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Requêtes en cours (file d'attente vue par la passerelle, cf. app/gateway)
+in_flight = 0
+
+@app.middleware("http")
+async def count_in_flight(request: Request, call_next):
+    global in_flight
+    in_flight += 1
+    try:
+        return await call_next(request)
+    finally:
+        in_flight -= 1
+
 # --- Variable Globale pour le Modèle ---
 model = None
+# Empreinte du fichier modèle (sert de clé aux caches de prédictions côté UI)
+model_hash = None
+# État du chargement : "loading" | "ready" | "missing" | "error"
+model_status = "loading"
+# Modèle float32 d'origine (référence des autres modes de précision)
+base_model = None
+precision = "float32"
+# Profil de démarrage (secondes) exposé par /health
+startup_timings = {}
+PROCESS_START = time.perf_counter()
 
-# --- Chargement du Modèle au Démarrage ---
-@app.on_event("startup")
-async def load_model():
-    global model
+def compute_model_hash(path):
+    """
+    Calcule l'empreinte SHA-256 (tronquée) du fichier modèle
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+def load_model_sync():
+    """
+    Importe TensorFlow et charge le modèle (exécuté dans un thread d'arrière-plan)
+    """
+    global model, model_hash, model_status, base_model
     try:
-        if os.path.exists(MODEL_PATH):
-            print(f"Chargement du modèle depuis {MODEL_PATH}...")
-            # compile=False car on n'a pas besoin de la fonction de perte pour l'inférence
-            # cela évite les erreurs avec les custom losses (Combo Loss) non définies
-            model = tf.keras.models.load_model(MODEL_PATH, compile=False)
-            print("✅ Modèle chargé avec succès.")
-        else:
+        if not os.path.exists(MODEL_PATH):
+            model_status = "missing"
             print(f"⚠️ ATTENTION : Modèle introuvable à {MODEL_PATH}")
             print("Veuillez vérifier le chemin ou uploader un modèle.")
+            return
+
+        t0 = time.perf_counter()
+        import tensorflow as tf
+        startup_timings["import_tensorflow"] = round(time.perf_counter() - t0, 3)
+
+        print(f"Chargement du modèle depuis {MODEL_PATH}...")
+        t0 = time.perf_counter()
+        # compile=False car on n'a pas besoin de la fonction de perte pour l'inférence
+        # cela évite les erreurs avec les custom losses (Combo Loss) non définies
+        loaded = tf.keras.models.load_model(MODEL_PATH, compile=False)
+        startup_timings["load_model"] = round(time.perf_counter() - t0, 3)
+
+        # Inférence de chauffe : la première prédiction trace le graphe
+        t0 = time.perf_counter()
+        loaded.predict(np.zeros((1, IMG_HEIGHT, IMG_WIDTH, 3), dtype=np.float32), verbose=0)
+        startup_timings["warmup"] = round(time.perf_counter() - t0, 3)
+
+        model_hash = compute_model_hash(MODEL_PATH)
+        base_model = loaded
+        model = loaded
+        model_status = "ready"
+        startup_timings["ready_since_process_start"] = round(time.perf_counter() - PROCESS_START, 3)
+        print(f"✅ Modèle chargé avec succès. {startup_timings}")
     except Exception as e:
+        model_status = "error"
         print(f"❌ Erreur lors du chargement du modèle : {e}")
+        return
+
+    # Le serveur sert déjà en float32 pendant la validation du mode demandé.
+    # Un échec ici (mode inconnu, conversion impossible) laisse le worker "ready" en float32.
+    if INFERENCE_PRECISION != "float32":
+        try:
+            report = set_precision(INFERENCE_PRECISION)
+            if report["accepted"]:
+                print(f"✅ Précision {INFERENCE_PRECISION} activée : {report}")
+            else:
+                print(f"⚠️ Précision {INFERENCE_PRECISION} refusée, maintien en float32 : {report}")
+        except Exception as e:
+            print(f"⚠️ Précision {INFERENCE_PRECISION} indisponible, maintien en float32 : {e}")
+
+# --- Exécution de l'Inférence ---
+# Un seul thread d'inférence : la boucle d'événements reste libre pendant model.predict
+# (/health et in_flight restent visibles par la passerelle) et les prédicteurs
+# non thread-safe (interpréteur TFLite, sessions de flux) sont sérialisés
+inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+
+async def run_inference(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, fn, *args)
+
+# --- Chargement du Modèle au Démarrage ---
+@app.on_event("startup")
+async def load_model():
+    # Le serveur répond (liveness) pendant que le modèle se charge en arrière-plan
+    startup_timings["server_up_since_process_start"] = round(time.perf_counter() - PROCESS_START, 3)
+    threading.Thread(target=load_model_sync, name="model-loader", daemon=True).start()
 
 # --- Palette de Couleurs (Cityscapes 8 classes) ---
 PALETTE = [
@@ -63,6 +198,15 @@ PALETTE = [
     [70, 130, 180],  # sky - Ciel
     [0, 0, 0]        # void - Noir
 ]
+CLASS_NAMES = ['flat', 'human', 'vehicle', 'construction', 'object', 'nature', 'sky', 'void']
+
+# --- Analytique ---
+# Classes pour lesquelles on extrait les objets (composantes connexes)
+OBJECT_CLASSES = (1, 2)  # human, vehicle
+# Surface minimale (pixels du masque) d'un objet pour filtrer le bruit
+MIN_BLOB_AREA = 16
+# Pas vertical (en lignes) d'échantillonnage du polygone de zone navigable
+POLYGON_ROW_STEP = 4
 
 # --- Fonctions Utilitaires ---
 def preprocess_image(image_bytes):
@@ -99,6 +243,34 @@ def postprocess_mask(pred_tensor):
     
     return mask.astype(np.uint8)
 
+def postprocess_with_confidence(pred_tensor):
+    """
+    Argmax + confiance (probabilité max) dans la même passe.
+    Retourne (masque uint8, confiance quantifiée uint8 [0-255], confiance moyenne par classe)
+    """
+    # pred_tensor shape: (1, 224, 224, 8) -> vue (224, 224, 8), sans copie
+    probs = pred_tensor[0]
+    mask = np.argmax(probs, axis=-1).astype(np.uint8)
+    
+    # Probabilité de la classe retenue, lue via l'argmax (224, 224) : pas de copie du tenseur complet
+    confidence = np.take_along_axis(probs, mask[..., None], axis=-1)[..., 0]
+    
+    # Moyenne par classe via bincount pondéré (None si la classe est absente)
+    flat_mask = mask.ravel()
+    sums = np.bincount(flat_mask, weights=confidence.ravel(), minlength=len(CLASS_NAMES))
+    counts = np.bincount(flat_mask, minlength=len(CLASS_NAMES))
+    class_confidence = {
+        name: round(float(total / n), 4) if n else None
+        for name, total, n in zip(CLASS_NAMES, sums, counts)
+    }
+    
+    # Quantification en place [0, 1] -> [0, 255]
+    np.multiply(confidence, 255.0, out=confidence)
+    np.rint(confidence, out=confidence)
+    confidence_u8 = confidence.astype(np.uint8)
+    
+    return mask, confidence_u8, class_confidence
+
 def colorize_mask(mask_array):
     """
     Applique la palette de couleurs sur un masque 2D (H, W)
@@ -113,16 +285,589 @@ def colorize_mask(mask_array):
         
     return Image.fromarray(colored_mask)
 
+def extract_blobs(mask_array, class_id):
+    """
+    Composantes connexes d'une classe : surface et boîte englobante [x_min, y_min, x_max, y_max]
+    """
+    from scipy import ndimage
+
+    labels, n = ndimage.label(mask_array == class_id)
+    if n == 0:
+        return []
+
+    areas = np.bincount(labels.ravel(), minlength=n + 1)[1:]
+    slices = ndimage.find_objects(labels)
+    blobs = [
+        {
+            "area": int(area),
+            "bbox": [sl[1].start, sl[0].start, sl[1].stop - 1, sl[0].stop - 1],
+        }
+        for area, sl in zip(areas, slices)
+        if area >= MIN_BLOB_AREA
+    ]
+    blobs.sort(key=lambda b: b["area"], reverse=True)
+    return blobs
+
+def drivable_polygon(mask_array, row_step=POLYGON_ROW_STEP):
+    """
+    Contour de la plus grande région 'flat' : bords gauche (haut -> bas)
+    puis droit (bas -> haut), une ligne sur row_step. Liste de [x, y].
+    """
+    from scipy import ndimage
+
+    labels, n = ndimage.label(mask_array == 0)
+    if n == 0:
+        return []
+
+    areas = np.bincount(labels.ravel())
+    areas[0] = 0
+    region = labels == areas.argmax()
+
+    rows = np.flatnonzero(region.any(axis=1))
+    sampled = rows[::row_step]
+    if sampled[-1] != rows[-1]:
+        sampled = np.append(sampled, rows[-1])
+
+    sub = region[sampled]
+    left = sub.argmax(axis=1)
+    right = sub.shape[1] - 1 - sub[:, ::-1].argmax(axis=1)
+
+    left_edge = np.stack([left, sampled], axis=1)
+    right_edge = np.stack([right, sampled], axis=1)[::-1]
+    return np.concatenate([left_edge, right_edge]).tolist()
+
+def compute_analytics(mask_array):
+    """
+    Résumé compact du masque : répartition des classes, objets human/vehicle
+    et polygone de la zone navigable
+    """
+    counts = np.bincount(mask_array.ravel(), minlength=len(CLASS_NAMES))
+    total = mask_array.size
+
+    return {
+        "class_fraction": {name: round(int(c) / total, 4) for name, c in zip(CLASS_NAMES, counts)},
+        "objects": {CLASS_NAMES[c]: extract_blobs(mask_array, c) for c in OBJECT_CLASSES},
+        "drivable_polygon": drivable_polygon(mask_array),
+    }
+
+# --- Précision d'Inférence ---
+# Rapports (latence, mémoire, accord avec float32) des modes déjà évalués
+precision_reports = {}
+precision_lock = threading.Lock()
+# Jeu de calibration coupé en deux (chargé une fois) : 1re moitié pour calibrer
+# la quantification int8, 2e moitié pour la valider (images jamais vues par la calibration)
+calibration_inputs = None
+validation_inputs = None
+# Masques float32 de référence du jeu de validation
+reference_masks = None
+
+class TFLitePredictor:
+    """
+    Interpréteur TFLite exposant la même interface que model.predict
+    """
+    def __init__(self, model_content):
+        import tensorflow as tf
+        self.interpreter = tf.lite.Interpreter(model_content=model_content, num_threads=os.cpu_count())
+        self.interpreter.allocate_tensors()
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self.size_bytes = len(model_content)
+
+    def predict(self, input_tensor, verbose=0):
+        outputs = []
+        for sample in input_tensor:
+            self.interpreter.set_tensor(self.input_index, sample[None].astype(np.float32))
+            self.interpreter.invoke()
+            outputs.append(self.interpreter.get_tensor(self.output_index))
+        return np.concatenate(outputs)
+
+def read_rss_mb():
+    """ RSS du processus en Mo (Linux uniquement, None ailleurs) """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+def load_calibration_inputs():
+    """
+    Tenseurs prétraités des CALIBRATION_SIZE premières images de calibration
+    """
+    if not os.path.isdir(CALIBRATION_DIR):
+        return []
+    files = sorted(f for f in os.listdir(CALIBRATION_DIR) if f.endswith('.png'))[:CALIBRATION_SIZE]
+    inputs = []
+    for name in files:
+        with open(os.path.join(CALIBRATION_DIR, name), "rb") as f:
+            inputs.append(preprocess_image(f.read()))
+    return inputs
+
+def build_precision_model(mode):
+    """
+    Construit le prédicteur d'un mode à partir du modèle float32 d'origine
+    """
+    import tensorflow as tf
+
+    if mode == "int8":
+        # Quantification entière (poids + activations) calibrée sur la 1re moitié du jeu,
+        # entrée / sortie conservées en float32
+        converter = tf.lite.TFLiteConverter.from_keras_model(base_model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([x] for x in calibration_inputs)
+        return TFLitePredictor(converter.convert())
+
+    # Clone du graphe avec la politique de précision imposée à chaque couche,
+    # puis recopie des poids (les variables restent en float32 en mode mixte)
+    def clone_layer(layer):
+        if isinstance(layer, tf.keras.layers.InputLayer):
+            return layer.__class__.from_config(layer.get_config())
+        config = layer.get_config()
+        config["dtype"] = mode
+        return layer.__class__.from_config(config)
+
+    clone = tf.keras.models.clone_model(base_model, clone_function=clone_layer)
+    clone.set_weights(base_model.get_weights())
+    return clone
+
+def masks_agreement(ref_masks, masks):
+    """
+    Accord pixel et mIoU d'un jeu de masques par rapport aux masques de référence
+    """
+    ref = np.stack(ref_masks).ravel()
+    pred = np.stack(masks).ravel()
+    agreement = float((ref == pred).mean())
+
+    n = len(CLASS_NAMES)
+    # Matrice de confusion via bincount sur les paires (référence, prédiction)
+    confusion = np.bincount(ref.astype(np.int64) * n + pred, minlength=n * n).reshape(n, n)
+    intersection = np.diag(confusion)
+    union = confusion.sum(axis=0) + confusion.sum(axis=1) - intersection
+    present = union > 0
+    miou = float((intersection[present] / union[present]).mean()) if present.any() else 1.0
+    return agreement, miou
+
+def run_validation(predictor):
+    """ Masques et latences (ms) d'un prédicteur sur le jeu de validation """
+    masks, latencies = [], []
+    for input_tensor in validation_inputs:
+        t0 = time.perf_counter()
+        predictions = predictor.predict(input_tensor, verbose=0)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        masks.append(postprocess_mask(predictions))
+    return masks, latencies
+
+def evaluate_precision(mode):
+    """
+    Construit un mode, mesure latence / mémoire et le valide contre float32.
+    Retourne (prédicteur, rapport)
+    """
+    global calibration_inputs, validation_inputs, reference_masks
+    if calibration_inputs is None:
+        inputs = load_calibration_inputs()
+        half = len(inputs) // 2
+        calibration_inputs, validation_inputs = inputs[:half], inputs[half:]
+    if not calibration_inputs:
+        return None, {"mode": mode, "accepted": mode == "float32",
+                      "reason": f"Au moins 2 images nécessaires dans {CALIBRATION_DIR} (calibration + validation)."}
+
+    if reference_masks is None:
+        reference_masks, latencies = run_validation(base_model)
+        precision_reports["float32"] = {
+            "mode": "float32", "accepted": True,
+            "latency_ms": round(float(np.median(latencies)), 2),
+            "weights_mb": round(sum(w.nbytes for w in base_model.get_weights()) / 2**20, 2),
+            "pixel_agreement": 1.0, "miou_vs_float32": 1.0,
+        }
+    if mode == "float32":
+        return base_model, precision_reports["float32"]
+
+    rss_before = read_rss_mb()
+    predictor = build_precision_model(mode)
+    # Chauffe (traçage du graphe / allocation de l'interpréteur) hors mesure
+    predictor.predict(calibration_inputs[0], verbose=0)
+    rss_after = read_rss_mb()
+
+    masks, latencies = run_validation(predictor)
+    agreement, miou = masks_agreement(reference_masks, masks)
+
+    if isinstance(predictor, TFLitePredictor):
+        weights_mb = predictor.size_bytes / 2**20
+    else:
+        weights_mb = sum(w.nbytes for w in predictor.get_weights()) / 2**20
+
+    reasons = []
+    if agreement < PRECISION_MIN_AGREEMENT:
+        reasons.append(f"accord pixel {agreement:.4f} < {PRECISION_MIN_AGREEMENT}")
+    if 1.0 - miou > PRECISION_MAX_MIOU_DROP:
+        reasons.append(f"perte de mIoU {1.0 - miou:.4f} > {PRECISION_MAX_MIOU_DROP}")
+
+    report = {
+        "mode": mode,
+        "accepted": not reasons,
+        "reason": "; ".join(reasons) or None,
+        "latency_ms": round(float(np.median(latencies)), 2),
+        "weights_mb": round(weights_mb, 2),
+        "rss_delta_mb": round(rss_after - rss_before, 1) if rss_before is not None and rss_after is not None else None,
+        "pixel_agreement": round(agreement, 5),
+        "miou_vs_float32": round(miou, 5),
+        "calibration_size": len(calibration_inputs),
+        "validation_size": len(validation_inputs),
+    }
+    precision_reports[mode] = report
+    return predictor, report
+
+def set_precision(mode, dry_run=False):
+    """
+    Évalue un mode et, s'il respecte les garde-fous, l'active pour toutes les requêtes
+    """
+    global model, precision
+    if mode not in PRECISION_MODES:
+        raise ValueError(f"Mode inconnu : {mode} (choix : {', '.join(PRECISION_MODES)})")
+
+    with precision_lock:
+        predictor, report = evaluate_precision(mode)
+        if report["accepted"] and not dry_run:
+            model = predictor if predictor is not None else base_model
+            precision = mode
+        return report
+
+# --- Cache des Masques ---
+# Masques par (sha1 du fichier, précision), du moins récent au plus récent (LRU).
+# Lu et modifié uniquement depuis les endpoints async (boucle d'événements)
+mask_cache = OrderedDict()
+
+def mask_cache_key(contents):
+    """
+    Empreinte calculée sur le contenu reçu (l'en-tête X-Content-Hash du client ne sert
+    qu'au routage : un hash erroné ne doit pas servir le masque d'une autre image)
+    """
+    return hashlib.sha1(contents).hexdigest(), precision
+
+def get_cached_mask(key):
+    mask = mask_cache.get(key)
+    if mask is not None:
+        mask_cache.move_to_end(key)
+    return mask
+
+def cache_mask(key, mask):
+    if MASK_CACHE_SIZE <= 0:
+        return
+    mask_cache[key] = mask
+    mask_cache.move_to_end(key)
+    while len(mask_cache) > MASK_CACHE_SIZE:
+        mask_cache.popitem(last=False)
+
+# --- Mode Temporel (Flux Vidéo) ---
+# Sessions actives, de la moins récente à la plus récente (LRU)
+stream_sessions = OrderedDict()
+
+def frame_thumbnail(img_tensor):
+    """
+    Vignette niveaux de gris (THUMB_SIZE x THUMB_SIZE) par moyenne de blocs,
+    calculée sur le tenseur déjà prétraité
+    """
+    gray = img_tensor[0].mean(axis=-1)
+    fh, fw = IMG_HEIGHT // THUMB_SIZE, IMG_WIDTH // THUMB_SIZE
+    return gray.reshape(THUMB_SIZE, fh, THUMB_SIZE, fw).mean(axis=(1, 3))
+
+def get_stream_session(session_id):
+    """
+    Récupère (ou crée) l'état d'une session, en purgeant les sessions expirées
+    """
+    now = time.monotonic()
+    expired = [sid for sid, sess in stream_sessions.items() if now - sess["last_seen"] > STREAM_SESSION_TTL]
+    for sid in expired:
+        del stream_sessions[sid]
+
+    session = stream_sessions.pop(session_id, None)
+    if session is None:
+        while len(stream_sessions) >= STREAM_MAX_SESSIONS:
+            stream_sessions.popitem(last=False)
+        session = {
+            "key_thumb": None,  # Vignette de la dernière image de référence (keyframe)
+            "probs": None,      # Probabilités (lissées) de la dernière inférence
+            "mask": None,
+            "frames_since_key": 0,
+            "frames": 0,
+            "inferences": 0,
+            "skipped": 0,
+        }
+    session["last_seen"] = now
+    stream_sessions[session_id] = session
+    return session
+
+def stream_stats(session):
+    return {
+        "frames": session["frames"],
+        "inferences": session["inferences"],
+        "skipped": session["skipped"],
+        "skipped_ratio": round(session["skipped"] / max(session["frames"], 1), 3),
+    }
+
+def predict_stream_frame(session, input_tensor):
+    """
+    Inférence incrémentale : réutilise le masque de la keyframe si l'image a peu changé,
+    sinon inférence complète lissée avec la précédente
+    """
+    thumb = frame_thumbnail(input_tensor)
+    diff = None
+    if session["key_thumb"] is not None:
+        diff = float(np.abs(thumb - session["key_thumb"]).mean())
+
+    session["frames"] += 1
+    reuse = (
+        diff is not None
+        and diff < STREAM_DIFF_THRESHOLD
+        # frames_since_key compte les images réutilisées depuis la keyframe :
+        # inférence complète toutes les STREAM_KEYFRAME_INTERVAL images
+        and session["frames_since_key"] < STREAM_KEYFRAME_INTERVAL - 1
+    )
+
+    if reuse:
+        session["frames_since_key"] += 1
+        session["skipped"] += 1
+    else:
+        probs = model.predict(input_tensor)[0]
+        if session["probs"] is not None and diff is not None and diff < STREAM_SCENE_CUT and STREAM_SMOOTHING < 1.0:
+            # Moyenne exponentielle en place (pas de copie supplémentaire)
+            probs *= STREAM_SMOOTHING
+            probs += (1.0 - STREAM_SMOOTHING) * session["probs"]
+        session["probs"] = probs
+        session["mask"] = np.argmax(probs, axis=-1).astype(np.uint8)
+        session["key_thumb"] = thumb
+        session["frames_since_key"] = 0
+        session["inferences"] += 1
+
+    return session["mask"], reuse, diff
+
+# --- Profilage par Requête ---
+# Traces conservées, de la plus ancienne à la plus récente (buffer circulaire)
+profiles = OrderedDict()
+# Le profileur TensorFlow est global au processus : une seule trace à la fois
+tf_profiler_lock = threading.Lock()
+# Idem pour cProfile (avant Python 3.12, un 2e enable() remplace silencieusement le 1er)
+python_profiler_lock = threading.Lock()
+
+class RequestProfile:
+    """
+    Collecte pour une requête : étapes chronométrées, profil Python (cProfile)
+    et trace TensorFlow op par op de model.predict
+    """
+    def __init__(self, endpoint, filename):
+        self.id = uuid.uuid4().hex[:12]
+        self.endpoint = endpoint
+        self.filename = filename
+        self.created = time.time()
+        self.events = []
+        self.tf_logdir = None
+        self.tf_error = None
+        self.finished = False
+        # Profil Python seulement si aucune autre requête n'est profilée (sinon étapes + trace TF)
+        self.profiler = cProfile.Profile() if python_profiler_lock.acquire(blocking=False) else None
+        self.t0 = time.perf_counter()
+
+    @contextmanager
+    def span(self, name, python_profile=True):
+        """
+        Chronomètre une étape. cProfile n'est actif que pendant les étapes synchrones
+        (python_profile=False autour d'un await) pour ne pas capturer les autres requêtes.
+        """
+        profiling = self.profiler is not None and python_profile
+        start = time.perf_counter()
+        if profiling:
+            self.profiler.enable()
+        try:
+            yield
+        finally:
+            if profiling:
+                self.profiler.disable()
+            # Format "Trace Event" (chrome://tracing, Perfetto) : temps en microsecondes
+            self.events.append({
+                "name": name, "ph": "X", "pid": 1, "tid": 1,
+                "ts": round((start - self.t0) * 1e6, 1),
+                "dur": round((time.perf_counter() - start) * 1e6, 1),
+            })
+
+    def predict(self, input_tensor):
+        """
+        model.predict sous le profileur TensorFlow (si disponible)
+        """
+        logdir = None
+        if tf_profiler_lock.acquire(blocking=False):
+            try:
+                import tensorflow as tf
+                logdir = tempfile.mkdtemp(prefix=f"profile_{self.id}_")
+                tf.profiler.experimental.start(logdir)
+            except Exception as e:
+                self.tf_error = str(e)
+                if logdir is not None:
+                    shutil.rmtree(logdir, ignore_errors=True)
+                logdir = None
+                tf_profiler_lock.release()
+        else:
+            self.tf_error = "Profileur TensorFlow occupé par une autre requête."
+
+        try:
+            with self.span("inference"):
+                return model.predict(input_tensor)
+        finally:
+            if logdir is not None:
+                tf.profiler.experimental.stop()
+                self.tf_logdir = logdir
+                tf_profiler_lock.release()
+
+    def finish(self):
+        """
+        Arrête le profil et l'enregistre dans le buffer circulaire
+        """
+        if self.finished:
+            return
+        self.finished = True
+        duration = time.perf_counter() - self.t0
+
+        self.pstats_data = None
+        top_functions = []
+        if self.profiler is not None:
+            python_profiler_lock.release()
+            stats = pstats.Stats(self.profiler)
+            self.pstats_data = marshal.dumps(stats.stats)
+            # stats.stats : (fichier, ligne, fonction) -> (appels prim., appels, temps propre, temps cumulé, appelants)
+            rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:30]
+            top_functions = [
+                {"function": f"{func} ({os.path.basename(path)}:{line})", "calls": nc,
+                 "self_ms": round(tt * 1000, 3), "cumulative_ms": round(ct * 1000, 3)}
+                for (path, line, func), (cc, nc, tt, ct, callers) in rows
+            ]
+
+        self.events.insert(0, {"name": self.endpoint, "ph": "X", "pid": 1, "tid": 0,
+                               "ts": 0, "dur": round(duration * 1e6, 1)})
+        self.duration_ms = round(duration * 1000, 3)
+        self.trace = {
+            "traceEvents": self.events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "profile_id": self.id,
+                "endpoint": self.endpoint,
+                "filename": self.filename,
+                "created": self.created,
+                "tf_trace_available": self.tf_logdir is not None,
+                "tf_error": self.tf_error,
+                "python_profile_available": self.profiler is not None,
+                "python_top_functions": top_functions,
+            },
+        }
+
+        profiles[self.id] = self
+        while len(profiles) > PROFILE_BUFFER_SIZE:
+            _, evicted = profiles.popitem(last=False)
+            if evicted.tf_logdir is not None:
+                shutil.rmtree(evicted.tf_logdir, ignore_errors=True)
+
+def start_profile(request, profile, endpoint, filename):
+    """
+    Démarre un profil si demandé (?profile=true ou X-Profile: 1) et autorisé par la config
+    """
+    if not PROFILING_ENABLED:
+        return None
+    if not (profile or request.headers.get("X-Profile") == "1"):
+        return None
+    return RequestProfile(endpoint, filename)
+
+def profile_span(prof, name, python_profile=True):
+    return prof.span(name, python_profile) if prof is not None else nullcontext()
+
+def check_admin_token(request):
+    if ADMIN_TOKEN and request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Jeton d'administration invalide.")
+
+def check_admin(request):
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profilage désactivé (PROFILING_ENABLED=1).")
+    check_admin_token(request)
+
+def get_profile(profile_id):
+    prof = profiles.get(profile_id)
+    if prof is None:
+        raise HTTPException(status_code=404, detail="Profil inconnu ou expiré.")
+    return prof
+
 # --- Endpoints ---
 @app.get("/")
 def read_root():
-    return {"status": "API is running", "model_loaded": model is not None}
+    return {"status": "API is running", "model_loaded": model is not None, "model_hash": model_hash,
+            "precision": precision}
+
+@app.get("/health")
+def health():
+    """
+    Liveness : répond dès que le serveur tourne, même si le modèle charge encore.
+    """
+    return {
+        "status": "alive",
+        "model_status": model_status,
+        # La requête /health elle-même n'est pas comptée
+        "in_flight": in_flight - 1,
+        "startup_timings": startup_timings,
+    }
+
+@app.get("/ready")
+def ready():
+    """
+    Readiness : 200 uniquement quand le modèle est prêt à servir.
+    """
+    if model is None:
+        raise HTTPException(status_code=503, detail=f"Modèle non prêt ({model_status}).")
+    return {"status": "ready", "model_hash": model_hash}
+
+@app.get("/precision")
+def get_precision():
+    """
+    Mode de précision actif et rapports (latence, mémoire, accord avec float32) des modes évalués
+    """
+    return {
+        "active": precision,
+        "modes": PRECISION_MODES,
+        "thresholds": {"min_pixel_agreement": PRECISION_MIN_AGREEMENT, "max_miou_drop": PRECISION_MAX_MIOU_DROP},
+        "reports": precision_reports,
+    }
+
+@app.post("/precision/{mode}")
+def change_precision(mode: str, request: Request, dry_run: bool = False):
+    """
+    Valide un mode sur le jeu de calibration et l'active s'il respecte les garde-fous.
+    Avec ?dry_run=true, renvoie seulement le rapport (latence, mémoire, accord).
+    Réservé à l'administration : ADMIN_TOKEN doit être défini et fourni dans X-Admin-Token.
+    """
+    # Change le modèle servi à tous les clients et coûte plusieurs minutes de CPU (int8)
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Changement de précision désactivé (définir ADMIN_TOKEN).")
+    check_admin_token(request)
+    if base_model is None:
+        raise HTTPException(status_code=503, detail="Le modèle n'est pas encore chargé.")
+    try:
+        report = set_precision(mode, dry_run=dry_run)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not report["accepted"]:
+        raise HTTPException(status_code=422, detail=report)
+    return {"active": precision, "report": report}
 
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(request: Request, response: Response, file: UploadFile = File(...),
+                  confidence: bool = False, profile: bool = False):
     """
     Reçoit une image, renvoie le masque de segmentation au format JSON (matrice brute).
     Idéal pour les applications clientes (Streamlit, React...).
+    Avec ?confidence=true, ajoute la carte de confiance (uint8) et la confiance moyenne par classe.
+    Avec ?profile=true (si PROFILING_ENABLED), l'identifiant de la trace est renvoyé dans X-Profile-Id.
+    Une image déjà vue est servie depuis le cache des masques (en-tête X-Cache: hit),
+    sauf avec ?confidence=true (probabilités nécessaires) ou un profilage.
     """
     if model is None:
         raise HTTPException(status_code=503, detail="Le modèle n'est pas encore chargé.")
@@ -130,33 +875,181 @@ async def predict(file: UploadFile = File(...)):
     if file.content_type.split("/")[0] != "image":
         raise HTTPException(status_code=400, detail="Le fichier doit être une image.")
 
+    prof = start_profile(request, profile, "/predict", file.filename)
     try:
         # 1. Lecture
-        contents = await file.read()
+        with profile_span(prof, "read", python_profile=False):
+            contents = await file.read()
+
+        cache_key = mask_cache_key(contents)
+        if not confidence and prof is None:
+            mask = get_cached_mask(cache_key)
+            if mask is not None:
+                response.headers["X-Cache"] = "hit"
+                return {
+                    "filename": file.filename,
+                    "mask": mask.tolist(),
+                    "shape": mask.shape
+                }
         
         # 2. Prétraitement
-        input_tensor = preprocess_image(contents)
+        with profile_span(prof, "preprocess"):
+            input_tensor = preprocess_image(contents)
         
         # 3. Inférence
-        predictions = model.predict(input_tensor)
+        predictions = await run_inference(prof.predict if prof is not None else model.predict, input_tensor)
         
         # 4. Post-traitement
-        mask = postprocess_mask(predictions)
+        if not confidence:
+            with profile_span(prof, "postprocess"):
+                mask = postprocess_mask(predictions)
+            cache_mask(cache_key, mask)
+            
+            # 5. Réponse
+            with profile_span(prof, "serialize"):
+                return {
+                    "filename": file.filename,
+                    "mask": mask.tolist(), # Conversion numpy -> list pour JSON
+                    "shape": mask.shape
+                }
+        
+        with profile_span(prof, "postprocess"):
+            mask, confidence_map, class_confidence = postprocess_with_confidence(predictions)
+        cache_mask(cache_key, mask)
+        
+        # 5. Réponse (même encodage que le masque pour la carte de confiance)
+        with profile_span(prof, "serialize"):
+            return {
+                "filename": file.filename,
+                "mask": mask.tolist(),
+                "shape": mask.shape,
+                "confidence": confidence_map.tolist(),
+                "confidence_scale": 255,
+                "class_confidence": class_confidence
+            }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if prof is not None:
+            prof.finish()
+            response.headers["X-Profile-Id"] = prof.id
+
+@app.post("/analyze")
+async def analyze(response: Response, file: UploadFile = File(...)):
+    """
+    Reçoit une image, renvoie un résumé analytique du masque (quelques Ko)
+    au lieu de la matrice complète. Idéal pour les planificateurs de trajectoire.
+    Le masque d'une image déjà vue est repris du cache (en-tête X-Cache: hit).
+    """
+    if model is None:
+        raise HTTPException(status_code=503, detail="Le modèle n'est pas encore chargé.")
+    
+    if file.content_type.split("/")[0] != "image":
+        raise HTTPException(status_code=400, detail="Le fichier doit être une image.")
+
+    try:
+        # 1. Lecture
+        contents = await file.read()
+
+        cache_key = mask_cache_key(contents)
+        mask = get_cached_mask(cache_key)
+        if mask is not None:
+            response.headers["X-Cache"] = "hit"
+        else:
+            # 2. Prétraitement
+            input_tensor = preprocess_image(contents)
+
+            # 3. Inférence
+            predictions = await run_inference(model.predict, input_tensor)
+
+            # 4. Post-traitement
+            mask = postprocess_mask(predictions)
+            cache_mask(cache_key, mask)
+        
+        # 5. Analytique
+        return {
+            "filename": file.filename,
+            "shape": mask.shape,
+            **compute_analytics(mask)
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict_stream")
+async def predict_stream(session_id: str, file: UploadFile = File(...)):
+    """
+    Comme /predict, pour des images consécutives d'un même flux (dash-cam).
+    Les images quasi identiques réutilisent le masque précédent au lieu d'une inférence complète.
+    """
+    if model is None:
+        raise HTTPException(status_code=503, detail="Le modèle n'est pas encore chargé.")
+    
+    if file.content_type.split("/")[0] != "image":
+        raise HTTPException(status_code=400, detail="Le fichier doit être une image.")
+
+    try:
+        # 1. Lecture
+        contents = await file.read()
         
-        # 5. Réponse
+        # 2. Prétraitement
+        input_tensor = preprocess_image(contents)
+        
+        # 3. Inférence (ou réutilisation)
+        session = get_stream_session(session_id)
+        mask, reused, diff = await run_inference(predict_stream_frame, session, input_tensor)
+        
+        # 4. Réponse
         return {
             "filename": file.filename,
-            "mask": mask.tolist(), # Conversion numpy -> list pour JSON
-            "shape": mask.shape
+            "mask": mask.tolist(),
+            "shape": mask.shape,
+            "stream": {
+                "session_id": session_id,
+                "reused": reused,
+                "diff": round(diff, 4) if diff is not None else None,
+                **stream_stats(session)
+            }
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-from fastapi.responses import Response
+# Les endpoints de session sont async : stream_sessions n'est lu et modifié que
+# depuis la boucle d'événements (comme dans get_stream_session), jamais depuis le threadpool
+@app.get("/stream")
+async def stream_summary():
+    """
+    Statistiques globales du mode temporel (calcul économisé sur toutes les sessions actives)
+    """
+    frames = sum(s["frames"] for s in stream_sessions.values())
+    skipped = sum(s["skipped"] for s in stream_sessions.values())
+    return {
+        "active_sessions": len(stream_sessions),
+        "frames": frames,
+        "skipped": skipped,
+        "skipped_ratio": round(skipped / max(frames, 1), 3),
+    }
+
+@app.get("/stream/{session_id}")
+async def stream_session_stats(session_id: str):
+    session = stream_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session inconnue ou expirée.")
+    return stream_stats(session)
+
+@app.delete("/stream/{session_id}")
+async def close_stream_session(session_id: str):
+    session = stream_sessions.pop(session_id, None)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session inconnue ou expirée.")
+    return stream_stats(session)
+
+from fastapi.responses import Response, JSONResponse
 
 @app.post("/predict_image")
-async def predict_image(file: UploadFile = File(...)):
+async def predict_image(request: Request, file: UploadFile = File(...), profile: bool = False):
     """
     Reçoit une image, renvoie l'image du masque colorisé directement (Format PNG).
     Idéal pour tester visuellement dans le navigateur ou Swagger UI.
@@ -167,31 +1060,113 @@ async def predict_image(file: UploadFile = File(...)):
     if file.content_type.split("/")[0] != "image":
         raise HTTPException(status_code=400, detail="Le fichier doit être une image.")
 
+    prof = start_profile(request, profile, "/predict_image", file.filename)
     try:
         # 1. Lecture
-        contents = await file.read()
+        with profile_span(prof, "read", python_profile=False):
+            contents = await file.read()
         
         # 2. Prétraitement
-        input_tensor = preprocess_image(contents)
+        with profile_span(prof, "preprocess"):
+            input_tensor = preprocess_image(contents)
         
         # 3. Inférence
-        predictions = model.predict(input_tensor)
+        predictions = await run_inference(prof.predict if prof is not None else model.predict, input_tensor)
         
         # 4. Post-traitement
-        mask = postprocess_mask(predictions)
+        with profile_span(prof, "postprocess"):
+            mask = postprocess_mask(predictions)
         
         # 5. Colorisation
-        colored_img = colorize_mask(mask)
+        with profile_span(prof, "colorize"):
+            colored_img = colorize_mask(mask)
         
         # 6. Conversion en bytes pour la réponse
-        img_byte_arr = io.BytesIO()
-        colored_img.save(img_byte_arr, format='PNG')
-        img_byte_arr = img_byte_arr.getvalue()
+        with profile_span(prof, "encode_png"):
+            img_byte_arr = io.BytesIO()
+            colored_img.save(img_byte_arr, format='PNG')
+            img_byte_arr = img_byte_arr.getvalue()
         
-        return Response(content=img_byte_arr, media_type="image/png")
+        headers = {}
+        if prof is not None:
+            prof.finish()
+            headers["X-Profile-Id"] = prof.id
+        return Response(content=img_byte_arr, media_type="image/png", headers=headers)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if prof is not None:
+            prof.finish()
+
+# --- Administration (Profils) ---
+@app.get("/admin/profiles")
+async def list_profiles(request: Request):
+    """
+    Liste les traces disponibles dans le buffer circulaire (plus récente en premier).
+    Async : le buffer n'est parcouru que sur la boucle d'événements, où finish() le modifie.
+    """
+    check_admin(request)
+    return [
+        {
+            "id": prof.id,
+            "endpoint": prof.endpoint,
+            "filename": prof.filename,
+            "created": prof.created,
+            "duration_ms": prof.duration_ms,
+            "tf_trace_available": prof.tf_logdir is not None,
+        }
+        for prof in reversed(profiles.values())
+    ]
+
+@app.get("/admin/profiles/{profile_id}")
+def download_profile_trace(profile_id: str, request: Request):
+    """
+    Trace au format Trace Event JSON (chrome://tracing, ui.perfetto.dev, speedscope)
+    """
+    check_admin(request)
+    prof = get_profile(profile_id)
+    return JSONResponse(
+        content=prof.trace,
+        headers={"Content-Disposition": f'attachment; filename="profile_{prof.id}.json"'},
+    )
+
+@app.get("/admin/profiles/{profile_id}/pstats")
+def download_profile_pstats(profile_id: str, request: Request):
+    """
+    Profil Python complet au format pstats (python -m pstats, snakeviz)
+    """
+    check_admin(request)
+    prof = get_profile(profile_id)
+    if prof.pstats_data is None:
+        raise HTTPException(status_code=404, detail="Profil Python indisponible pour cette requête.")
+    return Response(
+        content=prof.pstats_data,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="profile_{prof.id}.pstats"'},
+    )
+
+@app.get("/admin/profiles/{profile_id}/tf")
+def download_profile_tf(profile_id: str, request: Request):
+    """
+    Trace TensorFlow op par op (archive zip d'un logdir TensorBoard, onglet Profile)
+    """
+    check_admin(request)
+    prof = get_profile(profile_id)
+    if prof.tf_logdir is None:
+        raise HTTPException(status_code=404, detail=prof.tf_error or "Trace TensorFlow indisponible.")
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as archive:
+        for root, _, files in os.walk(prof.tf_logdir):
+            for name in files:
+                path = os.path.join(root, name)
+                archive.write(path, os.path.relpath(path, prof.tf_logdir))
+    return Response(
+        content=buf.getvalue(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="profile_{prof.id}_tf.zip"'},
+    )
 
 if __name__ == "__main__":
     # Pour lancer localement : python app/api/main.py
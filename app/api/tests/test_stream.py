@@ -0,0 +1,86 @@
+
+"""
+Mode temporel (predict_stream_frame) avec un modèle factice : nombre d'inférences
+réellement exécutées selon le contenu des images et STREAM_KEYFRAME_INTERVAL.
+
+Usage (depuis la racine du dépôt) :
+    python -m pytest app/api/tests -q
+"""
+import importlib.util
+import os
+import numpy as np
+import pytest
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Chargé sous un nom propre : app/gateway a aussi un main.py
+spec = importlib.util.spec_from_file_location("api_main", os.path.join(API_DIR, "main.py"))
+api = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(api)
+
+N_CLASSES = len(api.CLASS_NAMES)
+
+class StubModel:
+    """ Compte les appels à predict ; classe 0 si l'image est sombre, 3 sinon """
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, input_tensor, verbose=0):
+        self.calls += 1
+        probs = np.full((1, api.IMG_HEIGHT, api.IMG_WIDTH, N_CLASSES), 0.01, dtype=np.float32)
+        probs[..., 0 if input_tensor.mean() < 0.5 else 3] = 0.93
+        return probs
+
+def frame(value):
+    return np.full((1, api.IMG_HEIGHT, api.IMG_WIDTH, 3), value, dtype=np.float32)
+
+@pytest.fixture
+def stub(monkeypatch):
+    model = StubModel()
+    monkeypatch.setattr(api, "model", model)
+    monkeypatch.setattr(api, "STREAM_DIFF_THRESHOLD", 0.02)
+    monkeypatch.setattr(api, "STREAM_SCENE_CUT", 0.15)
+    monkeypatch.setattr(api, "STREAM_SMOOTHING", 0.7)
+    monkeypatch.setattr(api, "STREAM_KEYFRAME_INTERVAL", 10)
+    monkeypatch.setattr(api, "stream_sessions", api.OrderedDict())
+    return model
+
+def test_identical_frames_infer_once_per_keyframe_interval(stub):
+    session = api.get_stream_session("cam")
+    reused = [api.predict_stream_frame(session, frame(0.2))[1] for _ in range(25)]
+
+    # Inférences aux images 1, 11 et 21
+    assert stub.calls == 3
+    assert [i for i, r in enumerate(reused) if not r] == [0, 10, 20]
+    assert session["inferences"] == 3
+    assert session["skipped"] == 22
+
+def test_small_change_reuses_mask(stub):
+    session = api.get_stream_session("cam")
+    mask, reused, _ = api.predict_stream_frame(session, frame(0.2))
+    mask2, reused2, diff = api.predict_stream_frame(session, frame(0.21))
+
+    assert not reused
+    assert reused2 and diff < api.STREAM_DIFF_THRESHOLD
+    assert mask2 is mask
+    assert stub.calls == 1
+
+def test_scene_cut_runs_full_inference_without_smoothing(stub):
+    session = api.get_stream_session("cam")
+    api.predict_stream_frame(session, frame(0.2))
+    mask, reused, diff = api.predict_stream_frame(session, frame(0.9))
+
+    assert not reused and diff >= api.STREAM_SCENE_CUT
+    assert stub.calls == 2
+    # Pas de moyenne avec la scène précédente : masque et probabilités de la nouvelle image seule
+    assert (mask == 3).all()
+    np.testing.assert_array_equal(session["probs"], stub.predict(frame(0.9))[0])
+
+def test_keyframe_interval_one_infers_every_frame(stub, monkeypatch):
+    monkeypatch.setattr(api, "STREAM_KEYFRAME_INTERVAL", 1)
+    session = api.get_stream_session("cam")
+    reused = [api.predict_stream_frame(session, frame(0.2))[1] for _ in range(5)]
+
+    assert stub.calls == 5
+    assert not any(reused)
+    assert session["skipped"] == 0
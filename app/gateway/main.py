@@ -0,0 +1,285 @@
+
+import os
+import asyncio
+import hashlib
+import httpx
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import Response, JSONResponse
+import uvicorn
+
+# --- Configuration ---
+# URLs des workers (instances de app/api/main.py), séparées par des virgules
+WORKER_URLS = [u.strip().rstrip("/") for u in os.environ.get("WORKER_URLS", "http://127.0.0.1:8001").split(",") if u.strip()]
+# Intervalle (s) entre deux vérifications /health de chaque worker
+HEALTH_INTERVAL = float(os.environ.get("HEALTH_INTERVAL", "2.0"))
+# Écart de charge toléré avant de quitter le worker désigné par le hash
+LOAD_SLACK = int(os.environ.get("LOAD_SLACK", "2"))
+# Délai (ms) avant d'envoyer une requête de couverture (hedging) à un 2e worker (0 = désactivé)
+HEDGE_DELAY_MS = float(os.environ.get("HEDGE_DELAY_MS", "300"))
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", "60"))
+# Timeout (s) des requêtes diffusées : un changement de précision (conversion int8
+# + validation) peut prendre plusieurs minutes
+BROADCAST_TIMEOUT = float(os.environ.get("BROADCAST_TIMEOUT", "1800"))
+# Timeouts /health consécutifs avant de déclarer un worker en panne
+# (un worker occupé peut répondre lentement sans être mort)
+HEALTH_MAX_TIMEOUTS = int(os.environ.get("HEALTH_MAX_TIMEOUTS", "3"))
+
+# Endpoints sans état, pouvant être envoyés en double (hedging) sans effet de bord
+HEDGE_PATHS = {"predict", "predict_image", "analyze"}
+# Endpoints qui modifient l'état du modèle : diffusés à tous les workers
+BROADCAST_PREFIXES = ("precision/",)
+# En-têtes à ne pas recopier entre client, passerelle et worker
+HOP_HEADERS = {"host", "content-length", "content-encoding", "connection", "transfer-encoding", "keep-alive"}
+
+# --- Initialisation de l'App ---
+app = FastAPI(
+    title="Segmentation Gateway - P8",
+    description="Passerelle de répartition de charge devant plusieurs workers de l'API de segmentation",
+    version="1.0.0"
+)
+
+# --- État des Workers ---
+workers = {
+    url: {
+        "url": url,
+        "healthy": False,    # Répond à /health
+        "ready": False,      # Modèle chargé
+        "in_flight": 0,      # Requêtes envoyées par la passerelle, en cours
+        "queue_depth": 0,    # Requêtes en cours rapportées par le worker
+        "requests": 0,
+        "failures": 0,
+        "hedges": 0,
+        "health_timeouts": 0,  # Timeouts /health consécutifs
+    }
+    for url in WORKER_URLS
+}
+client = None
+
+async def check_worker(worker):
+    """
+    Met à jour l'état d'un worker à partir de son /health
+    """
+    try:
+        response = await client.get(f"{worker['url']}/health", timeout=2.0)
+        data = response.json()
+        worker["healthy"] = response.status_code == 200
+        worker["ready"] = data.get("model_status") == "ready"
+        worker["queue_depth"] = data.get("in_flight", 0)
+        worker["health_timeouts"] = 0
+    except httpx.TimeoutException:
+        # Worker probablement saturé : on garde son dernier état, il n'est écarté
+        # qu'après HEALTH_MAX_TIMEOUTS timeouts consécutifs
+        worker["health_timeouts"] += 1
+        if worker["health_timeouts"] >= HEALTH_MAX_TIMEOUTS:
+            worker["healthy"] = False
+            worker["ready"] = False
+    except (httpx.HTTPError, ValueError):
+        worker["healthy"] = False
+        worker["ready"] = False
+
+async def health_loop():
+    while True:
+        await asyncio.gather(*(check_worker(w) for w in workers.values()))
+        await asyncio.sleep(HEALTH_INTERVAL)
+
+@app.on_event("startup")
+async def start_gateway():
+    global client
+    client = httpx.AsyncClient(timeout=REQUEST_TIMEOUT)
+    # Première vérification avant d'accepter le trafic, puis en tâche de fond
+    await asyncio.gather(*(check_worker(w) for w in workers.values()))
+    app.state.health_task = asyncio.create_task(health_loop())
+
+@app.on_event("shutdown")
+async def stop_gateway():
+    app.state.health_task.cancel()
+    await client.aclose()
+
+# --- Routage ---
+def worker_load(worker):
+    # Le compteur local est à jour en continu, celui du worker inclut les autres clients
+    return max(worker["in_flight"], worker["queue_depth"])
+
+def rank_workers(key, sticky=False):
+    """
+    Ordre de préférence des workers pour une clé (hash de l'image ou session) :
+    hachage de rendez-vous, puis charge bornée vers le worker le moins chargé.
+    sticky=True (sessions de flux) : ordre du hash uniquement, l'état de session
+    n'existe que sur le worker désigné (les suivants ne servent qu'en cas de panne)
+    """
+    candidates = [w for w in workers.values() if w["healthy"] and w["ready"]]
+    if not candidates:
+        candidates = [w for w in workers.values() if w["healthy"]] or list(workers.values())
+
+    ranked = sorted(candidates, key=lambda w: hashlib.sha1(f"{key}|{w['url']}".encode()).digest(), reverse=True)
+
+    if sticky:
+        return ranked
+
+    # Le worker désigné par le hash est quitté s'il est nettement plus chargé que le moins chargé
+    least = min(ranked, key=worker_load)
+    if worker_load(ranked[0]) > worker_load(least) + LOAD_SLACK:
+        ranked.remove(least)
+        ranked.insert(0, least)
+    return ranked
+
+async def routing_key(path, query, request, body):
+    """
+    Affinité : même session de flux -> même worker, même image -> même worker.
+    Retourne (clé, sticky)
+    """
+    if "session_id" in query:
+        return f"session:{query['session_id']}", True
+    if path.startswith("stream/"):
+        return f"session:{path.split('/', 1)[1]}", True
+
+    # Hash fourni par le client (évite de relire l'image)
+    content_hash = request.headers.get("X-Content-Hash")
+    if content_hash:
+        return content_hash, False
+
+    # Le corps multipart contient une frontière aléatoire : on ne hache que le contenu du fichier
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        try:
+            upload = form.get("file")
+            if upload is not None and hasattr(upload, "read"):
+                return hashlib.sha1(await upload.read()).hexdigest(), False
+        finally:
+            await form.close()
+    return hashlib.sha1(body).hexdigest(), False
+
+async def send(worker, method, path, query, body, headers, timeout=httpx.USE_CLIENT_DEFAULT):
+    worker["in_flight"] += 1
+    worker["requests"] += 1
+    try:
+        return await client.request(method, f"{worker['url']}/{path}", params=query, content=body,
+                                    headers=headers, timeout=timeout)
+    finally:
+        worker["in_flight"] -= 1
+
+async def send_with_failover(ranked, method, path, query, body, headers):
+    """
+    Essaie les workers dans l'ordre ; un worker injoignable ou non prêt est écarté
+    """
+    last_error = None
+    for worker in ranked:
+        try:
+            response = await send(worker, method, path, query, body, headers)
+        except httpx.HTTPError as e:
+            worker["healthy"] = False
+            worker["failures"] += 1
+            last_error = str(e) or e.__class__.__name__
+            continue
+
+        if response.status_code == 503:
+            # Modèle pas (encore) chargé sur ce worker
+            worker["ready"] = False
+            last_error = response.text
+            continue
+        return response, worker
+
+    raise HTTPException(status_code=502, detail=f"Aucun worker disponible ({last_error}).")
+
+async def send_hedged(ranked, method, path, query, body, headers):
+    """
+    Envoie au 1er worker ; sans réponse après HEDGE_DELAY_MS, envoie aussi au 2e
+    et garde la première réponse valide (réduit la latence de queue)
+    """
+    primary = asyncio.create_task(send_with_failover(ranked, method, path, query, body, headers))
+    if HEDGE_DELAY_MS <= 0 or len(ranked) < 2:
+        return await primary
+
+    done, _ = await asyncio.wait({primary}, timeout=HEDGE_DELAY_MS / 1000)
+    if done:
+        return primary.result()
+
+    ranked[1]["hedges"] += 1
+    hedge = asyncio.create_task(send_with_failover(ranked[1:], method, path, query, body, headers))
+
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return task.result()
+            error = task.exception()
+    raise error
+
+def read_body(response):
+    """ Corps JSON d'une réponse de worker, ou texte brut s'il n'est pas JSON """
+    try:
+        return response.json()
+    except ValueError:
+        return response.text
+
+async def broadcast(method, path, query, body, headers):
+    """
+    Envoie la requête à tous les workers sains, avec le détail par worker.
+    200 si tous ont répondu en 2xx, le statut commun si tous ont échoué de la même façon, sinon 502
+    """
+    targets = [w for w in workers.values() if w["healthy"]]
+    if not targets:
+        raise HTTPException(status_code=502, detail="Aucun worker disponible.")
+
+    results = await asyncio.gather(
+        *(send(w, method, path, query, body, headers, timeout=BROADCAST_TIMEOUT) for w in targets),
+        return_exceptions=True,
+    )
+    content = {}
+    statuses = set()
+    for worker, result in zip(targets, results):
+        if isinstance(result, httpx.Response):
+            content[worker["url"]] = {"status_code": result.status_code, "body": read_body(result)}
+            statuses.add(result.status_code if not result.is_success else 200)
+        else:
+            content[worker["url"]] = {"error": str(result) or result.__class__.__name__}
+            statuses.add(502)
+    # Même statut partout (ex. 403 jeton invalide, 422 mode refusé) : relayé tel quel
+    status_code = statuses.pop() if len(statuses) == 1 else 502
+    return JSONResponse(content=content, status_code=status_code)
+
+def to_response(response, worker):
+    headers = {k: v for k, v in response.headers.items() if k.lower() not in HOP_HEADERS}
+    headers["X-Worker"] = worker["url"]
+    return Response(content=response.content, status_code=response.status_code, headers=headers)
+
+# --- Endpoints ---
+@app.get("/gateway/health")
+def gateway_health():
+    """
+    État de la passerelle et de chaque worker
+    """
+    return {
+        "status": "alive",
+        "workers_ready": sum(1 for w in workers.values() if w["healthy"] and w["ready"]),
+        "workers": list(workers.values()),
+    }
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "DELETE"])
+async def proxy(path: str, request: Request):
+    """
+    Relaie toute requête de l'API vers un worker (mêmes endpoints que app/api)
+    """
+    body = await request.body()
+    query = dict(request.query_params)
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_HEADERS}
+
+    # Changement de précision : appliqué à tous les workers pour garder un parc homogène
+    if request.method == "POST" and path.startswith(BROADCAST_PREFIXES):
+        return await broadcast(request.method, path, query, body, headers)
+
+    key, sticky = await routing_key(path, query, request, body)
+    ranked = rank_workers(key, sticky=sticky)
+    if request.method == "POST" and path in HEDGE_PATHS:
+        response, worker = await send_hedged(ranked, request.method, path, query, body, headers)
+    else:
+        response, worker = await send_with_failover(ranked, request.method, path, query, body, headers)
+    return to_response(response, worker)
+
+if __name__ == "__main__":
+    # Pour lancer localement : WORKER_URLS=http://127.0.0.1:8001,http://127.0.0.1:8002 python app/gateway/main.py
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("GATEWAY_PORT", "8000")))
@@ -0,0 +1,57 @@
+
+"""
+Lance localement N workers (app/api) sur des ports différents + la passerelle devant eux.
+
+Usage (depuis app/gateway) :
+    python run_local.py --workers 3
+Ctrl+C arrête tous les processus.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+GATEWAY_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(os.path.dirname(GATEWAY_DIR), "api")
+
+def main():
+    parser = argparse.ArgumentParser(description="Passerelle + workers locaux")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--base-port", type=int, default=8001, help="Port du 1er worker")
+    parser.add_argument("--gateway-port", type=int, default=8000)
+    args = parser.parse_args()
+
+    ports = [args.base_port + i for i in range(args.workers)]
+    processes = []
+    try:
+        for port in ports:
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+                cwd=API_DIR,
+            ))
+            print(f"Worker démarré sur le port {port}")
+
+        env = dict(os.environ, WORKER_URLS=",".join(f"http://127.0.0.1:{p}" for p in ports))
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "0.0.0.0", "--port", str(args.gateway_port)],
+            cwd=GATEWAY_DIR, env=env,
+        ))
+        print(f"Passerelle sur http://localhost:{args.gateway_port} (état : /gateway/health)")
+
+        while all(p.poll() is None for p in processes):
+            time.sleep(1)
+        print("⚠️ Un processus s'est arrêté, arrêt de tous les autres.")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+if __name__ == "__main__":
+    main()
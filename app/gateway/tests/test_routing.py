@@ -0,0 +1,121 @@
+
+"""
+Routage de la passerelle avec des workers simulés (httpx.MockTransport) :
+affinité par contenu, sessions collantes, hedging et bascule sur 503.
+
+Usage (depuis la racine du dépôt) :
+    python -m pytest app/gateway/tests -q
+"""
+import asyncio
+import importlib.util
+import os
+import time
+import httpx
+import pytest
+
+GATEWAY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Chargé sous un nom propre : app/api a aussi un main.py
+spec = importlib.util.spec_from_file_location("gateway_main", os.path.join(GATEWAY_DIR, "main.py"))
+gw = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(gw)
+
+WORKER_URLS = ["http://w1:8001", "http://w2:8002", "http://w3:8003"]
+
+def make_worker(url):
+    return {"url": url, "healthy": True, "ready": True, "in_flight": 0, "queue_depth": 0,
+            "requests": 0, "failures": 0, "hedges": 0, "health_timeouts": 0}
+
+@pytest.fixture
+def workers(monkeypatch):
+    pool = {url: make_worker(url) for url in WORKER_URLS}
+    monkeypatch.setattr(gw, "workers", pool)
+    monkeypatch.setattr(gw, "HEDGE_DELAY_MS", 0)
+    return pool
+
+def run(handler, *requests):
+    """
+    Envoie les requêtes à la passerelle (sans son cycle de démarrage), les workers
+    étant simulés par handler(request) ; retourne les réponses
+    """
+    async def scenario():
+        gw.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=gw.app),
+                                         base_url="http://gateway") as front:
+                return [await front.request(**kwargs) for kwargs in requests]
+        finally:
+            await gw.client.aclose()
+    return asyncio.run(scenario())
+
+def ok_handler(request):
+    return httpx.Response(200, json={"worker": f"{request.url.scheme}://{request.url.netloc.decode()}"})
+
+def multipart(content, boundary):
+    body = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="image.png"\r\n'
+        "Content-Type: image/png\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return {"method": "POST", "url": "/predict", "content": body,
+            "headers": {"Content-Type": f"multipart/form-data; boundary={boundary}"}}
+
+def test_same_file_with_different_boundaries_goes_to_same_worker(workers):
+    for i in range(5):
+        content = f"image-{i}".encode() * 100
+        responses = run(ok_handler, multipart(content, "boundaryA"), multipart(content, "boundaryB"),
+                        multipart(content, "x" * 30))
+        assert len({r.headers["X-Worker"] for r in responses}) == 1
+        # Routage par le hash du contenu du fichier uniquement
+        assert responses[0].headers["X-Worker"] == gw.rank_workers(gw.hashlib.sha1(content).hexdigest())[0]["url"]
+
+def test_session_is_never_moved_for_load(workers):
+    home = gw.rank_workers("session:cam", sticky=True)[0]
+    home["queue_depth"] = 100
+
+    responses = run(ok_handler, *[
+        {"method": "POST", "url": "/predict_stream", "params": {"session_id": "cam"}}
+        for _ in range(3)
+    ], {"method": "GET", "url": "/stream/cam"})
+    assert {r.headers["X-Worker"] for r in responses} == {home["url"]}
+
+    # Une requête sans session, elle, quitte un worker surchargé
+    assert gw.rank_workers("session:cam")[0] is not home
+
+def test_hedge_fires_after_delay(workers, monkeypatch):
+    monkeypatch.setattr(gw, "HEDGE_DELAY_MS", 50)
+    primary, backup = gw.rank_workers("img-1")[:2]
+
+    async def slow_primary(request):
+        if str(request.url).startswith(primary["url"]):
+            await asyncio.sleep(2)
+        return ok_handler(request)
+
+    start = time.perf_counter()
+    response, = run(slow_primary, {"method": "POST", "url": "/predict", "headers": {"X-Content-Hash": "img-1"}})
+    elapsed = time.perf_counter() - start
+
+    assert response.headers["X-Worker"] == backup["url"]
+    assert backup["hedges"] == 1
+    assert 0.05 <= elapsed < 1.5
+
+def test_no_hedge_when_primary_answers_in_time(workers, monkeypatch):
+    monkeypatch.setattr(gw, "HEDGE_DELAY_MS", 500)
+    primary = gw.rank_workers("img-1")[0]
+
+    response, = run(ok_handler, {"method": "POST", "url": "/predict", "headers": {"X-Content-Hash": "img-1"}})
+    assert response.headers["X-Worker"] == primary["url"]
+    assert sum(w["hedges"] for w in workers.values()) == 0
+
+def test_failover_on_503(workers):
+    primary, backup = gw.rank_workers("img-1")[:2]
+
+    def handler(request):
+        if str(request.url).startswith(primary["url"]):
+            return httpx.Response(503, json={"detail": "Le modèle n'est pas encore chargé."})
+        return ok_handler(request)
+
+    response, = run(handler, {"method": "POST", "url": "/predict", "headers": {"X-Content-Hash": "img-1"}})
+    assert response.status_code == 200
+    assert response.headers["X-Worker"] == backup["url"]
+    assert primary["ready"] is False
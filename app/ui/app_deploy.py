@@ -1,11 +1,13 @@
 
 import streamlit as st
 import requests
-from PIL import Image, ImageEnhance, ImageOps
+from PIL import Image, ImageOps
 import numpy as np
 import os
 import io
 
+from prediction_store import STORE_DIR, apply_transforms, fetch_store_key, open_store, lookup
+
 # --- Configuration ---
 # --- Configuration ---
 # Récupération de l'URL API depuis les secrets Streamlit Cloud
@@ -19,6 +21,14 @@ DATA_DIR = "../data/test_samples"
 IMG_DIR = os.path.join(DATA_DIR, "images")
 MASK_DIR = os.path.join(DATA_DIR, "masks")
 
+# Store de prédictions pré-calculées (voir precompute_predictions.py)
+# Par défaut on utilise le store du modèle et de la précision servis par l'API (GET /).
+# STORE_KEY ("<model_hash>_<precision>") permet de figer le store ; si l'API est injoignable, le plus récent est pris
+try:
+    STORE_KEY = st.secrets.get("STORE_KEY")
+except FileNotFoundError:
+    STORE_KEY = None
+
 # Palette de couleurs Cityscapes (8 classes)
 # 0:flat, 1:human, 2:vehicle, 3:construction, 4:object, 5:nature, 6:sky, 7:void
 PALETTE = [
@@ -54,18 +64,27 @@ def load_local_images():
     ids = [f.replace("_leftImg8bit.png", "") for f in files]
     return sorted(ids)
 
-def apply_transforms(image, brightness, contrast, flip):
-    """ Applique les transformations en temps réel """
-    if flip:
-        image = ImageOps.mirror(image)
-        
-    enhancer = ImageEnhance.Brightness(image)
-    image = enhancer.enhance(brightness)
-    
-    enhancer = ImageEnhance.Contrast(image)
-    image = enhancer.enhance(contrast)
-    
-    return image
+@st.cache_resource(ttl=600)
+def open_served_store():
+    """ Ouvre le store du modèle servi (memmap partagé entre sessions, revérifié toutes les 10 min) """
+    store_key = STORE_KEY
+    if store_key is None:
+        try:
+            store_key = fetch_store_key(API_URL, timeout=5)
+        except (requests.ConnectionError, requests.Timeout):
+            # API injoignable (mode hors-ligne) : store le plus récent
+            store_key = None
+    # Toute autre erreur (modèle en cours de chargement, HTTP 4xx/5xx) remonte :
+    # Streamlit ne met pas en cache un appel qui lève une exception
+    return open_store(STORE_DIR, store_key)
+
+def load_prediction_store():
+    """ Store à utiliser, ou None (API seule) si le modèle servi est inconnu pour l'instant """
+    try:
+        return open_served_store()
+    except Exception as e:
+        print(f"Store de prédictions ignoré : {e}")
+        return None
 
 def inject_custom_css():
     st.markdown("""
@@ -240,31 +259,36 @@ if selected_id:
     # Bouton de prédiction dans la sidebar pour ne pas casser l'alignement
     st.sidebar.markdown("---")
     if st.sidebar.button("🚀 Lancer la Prédiction", type="primary"):
-        with st.spinner("Analyse en cours..."):
-            buf = io.BytesIO()
-            transformed_image.save(buf, format="PNG")
-            buf.seek(0)
-            
-            try:
-                files = {"file": ("image.png", buf, "image/png")}
-                response = requests.post(API_URL, files=files)
+        # 1. Store pré-calculé (instantané), 2. API en direct si absent
+        mask_pred = lookup(load_prediction_store(), selected_id, brightness, contrast, flip)
+
+        if mask_pred is None:
+            with st.spinner("Analyse en cours..."):
+                buf = io.BytesIO()
+                transformed_image.save(buf, format="PNG")
+                buf.seek(0)
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    mask_pred = np.array(data["mask"], dtype=np.uint8)
-                    
-                    # Colorisation
-                    colored_mask_img = colorize_mask(mask_pred)
+                try:
+                    files = {"file": ("image.png", buf, "image/png")}
+                    response = requests.post(API_URL, files=files)
                     
-                    # Redimensionnement pour correspondre à l'image d'origine (et à l'affichage)
-                    # Le modèle sort du 224x224, mais on veut l'afficher aligné avec l'input
-                    colore_mask_resized = colored_mask_img.resize(transformed_image.size, resample=Image.NEAREST)
-                    
-                    st.session_state['pred_mask'] = colore_mask_resized
-                else:
-                    st.error(f"Erreur API: {response.status_code}")
-            except Exception as e:
-                st.error("API non disponible")
+                    if response.status_code == 200:
+                        data = response.json()
+                        mask_pred = np.array(data["mask"], dtype=np.uint8)
+                    else:
+                        st.error(f"Erreur API: {response.status_code}")
+                except Exception as e:
+                    st.error("API non disponible")
+
+        if mask_pred is not None:
+            # Colorisation
+            colored_mask_img = colorize_mask(mask_pred)
+            
+            # Redimensionnement pour correspondre à l'image d'origine (et à l'affichage)
+            # Le modèle sort du 224x224, mais on veut l'afficher aligné avec l'input
+            colore_mask_resized = colored_mask_img.resize(transformed_image.size, resample=Image.NEAREST)
+            
+            st.session_state['pred_mask'] = colore_mask_resized
 
     # Layout avec Colonnes
     col_input, col_truth, col_pred = st.columns(3)
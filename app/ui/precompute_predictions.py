@@ -0,0 +1,63 @@
+
+"""
+Pré-calcule les prédictions de l'API pour toutes les images de test et tous les
+préréglages de transformations, puis les écrit dans le store local.
+
+Usage (depuis app/ui) :
+    python precompute_predictions.py --api-url http://<EC2>:8000/predict
+"""
+import argparse
+import io
+import os
+import time
+import numpy as np
+import requests
+from PIL import Image
+
+from prediction_store import PRESETS, STORE_DIR, apply_transforms, fetch_store_key, make_key, write_store
+
+DATA_DIR = "../data/test_samples"
+IMG_DIR = os.path.join(DATA_DIR, "images")
+
+def load_local_images():
+    """ Scanne le dossier local pour trouver les IDs disponibles """
+    if not os.path.exists(IMG_DIR):
+        return []
+    files = [f for f in os.listdir(IMG_DIR) if f.endswith('.png')]
+    ids = [f.replace("_leftImg8bit.png", "") for f in files]
+    return sorted(ids)
+
+def main():
+    parser = argparse.ArgumentParser(description="Pré-calcul des prédictions pour la démo")
+    parser.add_argument("--api-url", default="http://localhost:8000/predict")
+    parser.add_argument("--store-dir", default=STORE_DIR)
+    args = parser.parse_args()
+
+    store_key = fetch_store_key(args.api_url)
+    ids = load_local_images()
+    if not ids:
+        raise SystemExit(f"Aucune image trouvée dans {IMG_DIR}")
+
+    print(f"Modèle {store_key} : {len(ids)} images x {len(PRESETS)} préréglages")
+    entries = []
+    start = time.perf_counter()
+    with requests.Session() as session:
+        for sample_id in ids:
+            original_image = Image.open(os.path.join(IMG_DIR, f"{sample_id}_leftImg8bit.png")).convert('RGB')
+            for brightness, contrast, flip in PRESETS:
+                image = apply_transforms(original_image, brightness, contrast, flip)
+                buf = io.BytesIO()
+                image.save(buf, format="PNG")
+                buf.seek(0)
+
+                files = {"file": ("image.png", buf, "image/png")}
+                response = session.post(args.api_url, files=files, timeout=120)
+                response.raise_for_status()
+                mask = np.array(response.json()["mask"], dtype=np.uint8)
+                entries.append((make_key(sample_id, brightness, contrast, flip), mask))
+
+    out_dir = write_store(args.store_dir, store_key, entries)
+    print(f"✅ {len(entries)} masques écrits dans {out_dir} ({time.perf_counter() - start:.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+import requests
+from PIL import ImageEnhance, ImageOps
+
+# --- Configuration ---
+# Dossier racine des stores (un sous-dossier par empreinte de modèle et précision)
+STORE_DIR = "../data/prediction_store"
+MASKS_FILE = "masks.u8"
+MANIFEST_FILE = "manifest.json"
+
+# Taille des masques renvoyés par l'API
+MASK_HEIGHT = 224
+MASK_WIDTH = 224
+
+# Préréglages de transformations pré-calculés : (luminosité, contraste, flip)
+# Les valeurs doivent tomber sur le pas des sliders de l'UI (0.1)
+PRESETS = [
+    (1.0, 1.0, False),  # Image originale
+    (1.0, 1.0, True),   # Miroir
+    (0.5, 1.0, False),  # Sombre (nuit)
+    (1.5, 1.0, False),  # Surexposée
+    (1.0, 0.5, False),  # Brouillard
+    (1.0, 1.5, False),  # Contraste fort
+]
+
+# --- Fonctions Utilitaires ---
+
+def apply_transforms(image, brightness, contrast, flip):
+    """ Transformations de l'UI, partagées avec le pré-calcul (les clés du store en dépendent) """
+    if flip:
+        image = ImageOps.mirror(image)
+
+    enhancer = ImageEnhance.Brightness(image)
+    image = enhancer.enhance(brightness)
+
+    enhancer = ImageEnhance.Contrast(image)
+    image = enhancer.enhance(contrast)
+
+    return image
+
+def make_store_key(model_hash, precision):
+    """ Un store par modèle ET par précision d'inférence (les masques int8 != float32) """
+    return f"{model_hash}_{precision}"
+
+def fetch_store_key(api_url, timeout=30):
+    """ Clé du store du modèle servi, via le health check de l'API (model_hash + precision) """
+    root_url = api_url.rsplit("/", 1)[0] + "/"
+    response = requests.get(root_url, timeout=timeout)
+    response.raise_for_status()
+    data = response.json()
+    model_hash = data.get("model_hash")
+    if not model_hash:
+        raise RuntimeError("L'API n'a pas de modèle chargé (model_hash absent).")
+    return make_store_key(model_hash, data.get("precision", "float32"))
+
+def make_key(sample_id, brightness, contrast, flip):
+    """ Clé d'index d'une prédiction (arrondie au pas des sliders) """
+    return f"{sample_id}|{brightness:.1f}|{contrast:.1f}|{int(bool(flip))}"
+
+def write_store(store_dir, store_key, entries):
+    """
+    Écrit les masques dans un fichier unique mappé en mémoire + un manifeste.
+    entries : liste de (clé, masque uint8 (H, W))
+    Le store est construit dans un dossier temporaire puis mis en place par os.replace :
+    un lecteur ne voit jamais un manifeste pointant vers un masks.u8 en cours de réécriture.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    out_dir = os.path.join(store_dir, store_key)
+    # Dossier caché, sur le même système de fichiers (os.replace reste un simple renommage)
+    tmp_dir = tempfile.mkdtemp(dir=store_dir, prefix=f".{store_key}.")
+    try:
+        masks = np.memmap(os.path.join(tmp_dir, MASKS_FILE), dtype=np.uint8, mode="w+",
+                          shape=(len(entries), MASK_HEIGHT, MASK_WIDTH))
+        index = {}
+        for i, (key, mask) in enumerate(entries):
+            masks[i] = mask
+            index[key] = i
+        masks.flush()
+        del masks
+
+        manifest = {
+            "store_key": store_key,
+            "shape": [len(entries), MASK_HEIGHT, MASK_WIDTH],
+            "dtype": "uint8",
+            "index": index,
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f)
+
+        # os.replace ne remplace pas un dossier non vide : l'ancien store est d'abord écarté.
+        # Les memmaps déjà ouverts sur l'ancien masks.u8 restent valides après sa suppression.
+        old_dir = None
+        if os.path.exists(out_dir):
+            old_dir = tempfile.mkdtemp(dir=store_dir, prefix=f".{store_key}.old.")
+            os.replace(out_dir, os.path.join(old_dir, store_key))
+        os.replace(tmp_dir, out_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return out_dir
+
+def find_latest_key(store_dir):
+    """ Clé du store le plus récent (None si aucun) """
+    if not os.path.exists(store_dir):
+        return None
+    # Les dossiers cachés sont des stores en cours d'écriture ou de remplacement
+    candidates = [d for d in os.listdir(store_dir)
+                  if not d.startswith(".") and os.path.exists(os.path.join(store_dir, d, MANIFEST_FILE))]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda d: os.path.getmtime(os.path.join(store_dir, d, MANIFEST_FILE)))
+
+def open_store(store_dir, store_key=None):
+    """
+    Ouvre un store en lecture seule (memmap, pas de chargement en RAM).
+    Retourne (masks, index) ou None si le store n'existe pas.
+    """
+    if store_key is None:
+        store_key = find_latest_key(store_dir)
+        if store_key is None:
+            return None
+
+    manifest_path = os.path.join(store_dir, store_key, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if not manifest["index"]:
+        return None
+
+    masks = np.memmap(os.path.join(store_dir, store_key, MASKS_FILE), dtype=manifest["dtype"],
+                      mode="r", shape=tuple(manifest["shape"]))
+    return masks, manifest["index"]
+
+def lookup(store, sample_id, brightness, contrast, flip):
+    """ Renvoie le masque pré-calculé ou None (miss) """
+    if store is None:
+        return None
+    masks, index = store
+    i = index.get(make_key(sample_id, brightness, contrast, flip))
+    if i is None:
+        return None
+    return np.asarray(masks[i])